@@ -5,7 +5,7 @@ from seller import download_stock
 
 import requests
 
-from seller import divide, price_conversion
+from seller import divide, price_conversion, run, send_batches, session, stock_conversion
 
 logger = logging.getLogger(__file__)
 
@@ -40,7 +40,7 @@ def get_product_list(page, campaign_id, access_token):
         "limit": 200,
     }
     url = endpoint_url + f"campaigns/{campaign_id}/offer-mapping-entries"
-    response = requests.get(url, headers=headers, params=payload)
+    response = session.get(url, headers=headers, params=payload)
     response.raise_for_status()
     response_object = response.json()
     return response_object.get("result")
@@ -69,7 +69,7 @@ def update_stocks(stocks, campaign_id, access_token):
     }
     payload = {"skus": stocks}
     url = endpoint_url + f"campaigns/{campaign_id}/offers/stocks"
-    response = requests.put(url, headers=headers, json=payload)
+    response = session.put(url, headers=headers, json=payload)
     response.raise_for_status()
     response_object = response.json()
     return response_object
@@ -98,7 +98,7 @@ def update_price(prices, campaign_id, access_token):
     }
     payload = {"offers": prices}
     url = endpoint_url + f"campaigns/{campaign_id}/offer-prices/updates"
-    response = requests.post(url, headers=headers, json=payload)
+    response = session.post(url, headers=headers, json=payload)
     response.raise_for_status()
     response_object = response.json()
     return response_object
@@ -115,16 +115,16 @@ def get_offer_ids(campaign_id, market_token):
         list: Список shopSku (артикулов) товаров продавца
     """
     page = ""
-    product_list = []
+    offer_ids = []
     while True:
         some_prod = get_product_list(page, campaign_id, market_token)
-        product_list.extend(some_prod.get("offerMappingEntries"))
+        offer_ids.extend(
+            product.get("offer").get("shopSku")
+            for product in some_prod.get("offerMappingEntries")
+        )
         page = some_prod.get("paging").get("nextPageToken")
         if not page:
             break
-    offer_ids = []
-    for product in product_list:
-        offer_ids.append(product.get("offer").get("shopSku"))
     return offer_ids
 
 
@@ -135,7 +135,7 @@ def create_stocks(watch_remnants, offer_ids, warehouse_id):
         watch_remnants (list): Список словарей с остатками товаров
             - Конвертирует количество в числовой формат (">10" -> 100, "1" -> 0)
             - Формирует запись об остатке с актуальным количеством
-        offer_ids (list): Список артикулов товаров, загруженных в Маркет
+        offer_ids (set): Множество артикулов товаров, загруженных в Маркет
             - Устанавливает количество 0 (отсутствие на складе)
         warehouse_id (str): Идентификатор склада в Яндекс.Маркете
 
@@ -143,20 +143,16 @@ def create_stocks(watch_remnants, offer_ids, warehouse_id):
         list[dict]: Список для обновления остатков
     """
     # Уберем то, что не загружено в market
+    matched = set()
     stocks = list()
     date = str(datetime.datetime.utcnow().replace(microsecond=0).isoformat() + "Z")
     for watch in watch_remnants:
-        if str(watch.get("Код")) in offer_ids:
-            count = str(watch.get("Количество"))
-            if count == ">10":
-                stock = 100
-            elif count == "1":
-                stock = 0
-            else:
-                stock = int(watch.get("Количество"))
+        code = str(watch["Код"])
+        if code in offer_ids and code not in matched:
+            stock = stock_conversion(str(watch["Количество"]))
             stocks.append(
                 {
-                    "sku": str(watch.get("Код")),
+                    "sku": code,
                     "warehouseId": warehouse_id,
                     "items": [
                         {
@@ -167,10 +163,10 @@ def create_stocks(watch_remnants, offer_ids, warehouse_id):
                     ],
                 }
             )
-            offer_ids.remove(str(watch.get("Код")))
+            matched.add(code)
     # Добавим недостающее из загруженного:
-    for offer_id in offer_ids:
-        stocks.append(
+    stocks.extend(
+        [
             {
                 "sku": offer_id,
                 "warehouseId": warehouse_id,
@@ -182,7 +178,9 @@ def create_stocks(watch_remnants, offer_ids, warehouse_id):
                     }
                 ],
             }
-        )
+            for offer_id in offer_ids - matched
+        ]
+    )
     return stocks
 
 
@@ -191,7 +189,7 @@ def create_prices(watch_remnants, offer_ids):
     
     Args:
         watch_remnants (list[dict]): Список товаров с остатками
-        offer_ids (list): Список артикулов товаров, загруженных в Маркет
+        offer_ids (set): Множество артикулов товаров, загруженных в Маркет
 
     Returns:
         list[dict]: Список цен в формате Яндекс.Маркета
@@ -200,50 +198,54 @@ def create_prices(watch_remnants, offer_ids):
         - Функция использует вспомогательную функцию price_conversion() для преобразования цены
 
     """
-    prices = []
-    for watch in watch_remnants:
-        if str(watch.get("Код")) in offer_ids:
-            price = {
-                "id": str(watch.get("Код")),
-                # "feed": {"id": 0},
-                "price": {
-                    "value": int(price_conversion(watch.get("Цена"))),
-                    # "discountBase": 0,
-                    "currencyId": "RUR",
-                    # "vat": 0,
-                },
-                # "marketSku": 0,
-                # "shopSku": "string",
-            }
-            prices.append(price)
+    prices = [
+        {
+            "id": code,
+            # "feed": {"id": 0},
+            "price": {
+                "value": int(price_conversion(watch["Цена"])),
+                # "discountBase": 0,
+                "currencyId": "RUR",
+                # "vat": 0,
+            },
+            # "marketSku": 0,
+            # "shopSku": "string",
+        }
+        for watch in watch_remnants
+        if (code := str(watch["Код"])) in offer_ids
+    ]
     return prices
 
 
-async def upload_prices(watch_remnants, campaign_id, market_token):
+async def upload_prices(watch_remnants, campaign_id, market_token, offer_ids=None):
     """Асинхронно загружает цены товаров в Яндекс.Маркет.
     
-    Получает список товаров кампании, формирует цены и отправляет их в API,
-    разбивая по 500 товаров.
+    Получает список товаров кампании, формирует цены и параллельно отправляет
+    их в API, разбивая по 500 товаров.
 
     Args:
         watch_remnants (list): Список товаров с остатками и ценами
         campaign_id (str): Идентификатор кампании продавца
         market_token (str): Токен доступа к API Яндекс.Маркета
+        offer_ids (set, optional): Уже полученные артикулы товаров кампании.
+            Если не переданы, запрашиваются через get_offer_ids()
 
     Returns:
         list: Сформированный список всех цен для загрузки
     """
-    offer_ids = get_offer_ids(campaign_id, market_token)
+    if offer_ids is None:
+        offer_ids = set(get_offer_ids(campaign_id, market_token))
     prices = create_prices(watch_remnants, offer_ids)
-    for some_prices in list(divide(prices, 500)):
-        update_price(some_prices, campaign_id, market_token)
+    await send_batches(update_price, divide(prices, 500), campaign_id, market_token)
     return prices
 
 
-async def upload_stocks(watch_remnants, campaign_id, market_token, warehouse_id):
+async def upload_stocks(
+    watch_remnants, campaign_id, market_token, warehouse_id, offer_ids=None
+):
     """Асинхронно обновляет остатки товаров на складе Яндекс.Маркета.
     
-    Получает актуальные остатки товаров и отправляет их в API,
+    Получает актуальные остатки товаров и параллельно отправляет их в API,
     разбивая по 2000 товаров.
     Возвращает товары с ненулевым остатком и полный список всех остатков.
     
@@ -252,6 +254,8 @@ async def upload_stocks(watch_remnants, campaign_id, market_token, warehouse_id)
         campaign_id (str): Идентификатор кампании продавца
         market_token (str): Токен доступа к API Яндекс.Маркета
         warehouse_id (str): Идентификатор склада в Яндекс.Маркете
+        offer_ids (set, optional): Уже полученные артикулы товаров кампании.
+            Если не переданы, запрашиваются через get_offer_ids()
 
     Returns:
         tuple: Кортеж из двух элементов:
@@ -259,17 +263,17 @@ async def upload_stocks(watch_remnants, campaign_id, market_token, warehouse_id)
             - list: Все товары с остатками (включая нулевые)
 
     """
-    offer_ids = get_offer_ids(campaign_id, market_token)
+    if offer_ids is None:
+        offer_ids = set(get_offer_ids(campaign_id, market_token))
     stocks = create_stocks(watch_remnants, offer_ids, warehouse_id)
-    for some_stock in list(divide(stocks, 2000)):
-        update_stocks(some_stock, campaign_id, market_token)
+    await send_batches(update_stocks, divide(stocks, 2000), campaign_id, market_token)
     not_empty = list(
         filter(lambda stock: (stock.get("items")[0].get("count") != 0), stocks)
     )
     return not_empty, stocks
 
 
-def main():
+async def main():
     env = Env()
     market_token = env.str("MARKET_TOKEN")
     campaign_fbs_id = env.str("FBS_ID")
@@ -280,29 +284,27 @@ def main():
     watch_remnants = download_stock()
     try:
         # FBS
-        offer_ids = get_offer_ids(campaign_fbs_id, market_token)
+        offer_ids = set(get_offer_ids(campaign_fbs_id, market_token))
         # Обновить остатки FBS
-        stocks = create_stocks(watch_remnants, offer_ids, warehouse_fbs_id)
-        for some_stock in list(divide(stocks, 2000)):
-            update_stocks(some_stock, campaign_fbs_id, market_token)
+        await upload_stocks(
+            watch_remnants, campaign_fbs_id, market_token, warehouse_fbs_id, offer_ids
+        )
         # Поменять цены FBS
-        upload_prices(watch_remnants, campaign_fbs_id, market_token)
+        await upload_prices(watch_remnants, campaign_fbs_id, market_token, offer_ids)
 
         # DBS
-        offer_ids = get_offer_ids(campaign_dbs_id, market_token)
+        offer_ids = set(get_offer_ids(campaign_dbs_id, market_token))
         # Обновить остатки DBS
-        stocks = create_stocks(watch_remnants, offer_ids, warehouse_dbs_id)
-        for some_stock in list(divide(stocks, 2000)):
-            update_stocks(some_stock, campaign_dbs_id, market_token)
+        await upload_stocks(
+            watch_remnants, campaign_dbs_id, market_token, warehouse_dbs_id, offer_ids
+        )
         # Поменять цены DBS
-        upload_prices(watch_remnants, campaign_dbs_id, market_token)
+        await upload_prices(watch_remnants, campaign_dbs_id, market_token, offer_ids)
     except requests.exceptions.ReadTimeout:
         print("Превышено время ожидания...")
     except requests.exceptions.ConnectionError as error:
         print(error, "Ошибка соединения")
-    except Exception as error:
-        print(error, "ERROR_2")
 
 
 if __name__ == "__main__":
-    main()
+    run(main())
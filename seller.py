@@ -1,15 +1,65 @@
+import asyncio
+import functools
 import io
 import logging.config
-import os
 import re
+import shutil
 import zipfile
 from environs import Env
+from itertools import islice
+from operator import itemgetter
 
-import pandas as pd
+import orjson
 import requests
+from python_calamine import CalamineWorkbook
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 logger = logging.getLogger(__file__)
 
+NON_DIGITS = re.compile("[^0-9]")
+
+STOCK_OVERRIDES = {">10": 100, "1": 0}
+
+REMNANT_COLUMNS = ("Код", "Количество", "Цена")
+
+try:
+    from itertools import batched
+except ImportError:  # Python < 3.12
+
+    def batched(iterable, n):
+        if n < 1:
+            raise ValueError("n must be at least one")
+        iterator = iter(iterable)
+        while batch := tuple(islice(iterator, n)):
+            yield batch
+
+
+def create_session():
+    """Создаёт HTTP-сессию с пулом соединений.
+
+    Сессия переиспользует TCP и TLS соединения между запросами к одному хосту
+    и с экспоненциальной задержкой повторяет запрос при временных ошибках сервера.
+    Запросы обновления цен и остатков идемпотентны, поэтому POST и PUT
+    тоже повторяются.
+
+    Returns:
+        requests.Session: Настроенная сессия.
+    """
+    retries = Retry(
+        total=5,
+        backoff_factor=0.5,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=["GET", "POST", "PUT"],
+    )
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=retries)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    return session
+
+
+session = create_session()
+
 
 def get_product_list(last_id, client_id, seller_token):
     """Получает пагинированный список товаров через озон Seller API.
@@ -38,6 +88,7 @@ def get_product_list(last_id, client_id, seller_token):
     headers = {
         "Client-Id": client_id,
         "Api-Key": seller_token,
+        "Content-Type": "application/json",
     }
     payload = {
         "filter": {
@@ -46,9 +97,9 @@ def get_product_list(last_id, client_id, seller_token):
         "last_id": last_id,
         "limit": 1000,
     }
-    response = requests.post(url, json=payload, headers=headers)
+    response = session.post(url, data=orjson.dumps(payload), headers=headers)
     response.raise_for_status()
-    response_object = response.json()
+    response_object = orjson.loads(response.content)
     return response_object.get("result")
 
 
@@ -66,17 +117,14 @@ def get_offer_ids(client_id, seller_token):
         Возвращает пустой список, если товаров нет или произошла ошибка.
     """
     last_id = ""
-    product_list = []
+    offer_ids = []
     while True:
         some_prod = get_product_list(last_id, client_id, seller_token)
-        product_list.extend(some_prod.get("items"))
+        offer_ids.extend(product.get("offer_id") for product in some_prod.get("items"))
         total = some_prod.get("total")
         last_id = some_prod.get("last_id")
-        if total == len(product_list):
+        if total == len(offer_ids):
             break
-    offer_ids = []
-    for product in product_list:
-        offer_ids.append(product.get("offer_id"))
     return offer_ids
 
 
@@ -95,11 +143,12 @@ def update_price(prices: list, client_id, seller_token):
     headers = {
         "Client-Id": client_id,
         "Api-Key": seller_token,
+        "Content-Type": "application/json",
     }
     payload = {"prices": prices}
-    response = requests.post(url, json=payload, headers=headers)
+    response = session.post(url, data=orjson.dumps(payload), headers=headers)
     response.raise_for_status()
-    return response.json()
+    return orjson.loads(response.content)
 
 
 def update_stocks(stocks: list, client_id, seller_token):
@@ -117,20 +166,21 @@ def update_stocks(stocks: list, client_id, seller_token):
     headers = {
         "Client-Id": client_id,
         "Api-Key": seller_token,
+        "Content-Type": "application/json",
     }
     payload = {"stocks": stocks}
-    response = requests.post(url, json=payload, headers=headers)
+    response = session.post(url, data=orjson.dumps(payload), headers=headers)
     response.raise_for_status()
-    return response.json()
+    return orjson.loads(response.content)
 
 
 def download_stock():
     """Скачивает файл ostatki с сайта casio.
     
     Скачивает zip-архив с актуальными остатками с сайта timeworld.ru.
-    Извлекает файл 'ostatki.xls' и читает данные из excel-файла.
-    Преобразует данные в список словарей.
-    Удаляет временные файлы.
+    Читает файл 'ostatki.xls' прямо из архива, не распаковывая его на диск.
+    Преобразует данные в список словарей, оставляя только колонки
+    "Код", "Количество" и "Цена".
 
     Returns:
         list[dict]: Список словарей с информацией о часах.
@@ -140,23 +190,50 @@ def download_stock():
     """
     # Скачать остатки с сайта
     casio_url = "https://timeworld.ru/upload/files/ostatki.zip"
-    session = requests.Session()
-    response = session.get(casio_url)
-    response.raise_for_status()
-    with response, zipfile.ZipFile(io.BytesIO(response.content)) as archive:
-        archive.extractall(".")
+    archive_file = io.BytesIO()
+    # zip уже сжат, повторное gzip-сжатие на сервере только тратит время
+    headers = {"Accept-Encoding": "identity"}
+    with session.get(casio_url, headers=headers, stream=True) as response:
+        response.raise_for_status()
+        response.raw.decode_content = True
+        shutil.copyfileobj(response.raw, archive_file)
     # Создаем список остатков часов:
-    excel_file = "ostatki.xls"
-    watch_remnants = pd.read_excel(
-        io=excel_file,
-        na_values=None,
-        keep_default_na=False,
-        header=17,
-    ).to_dict(orient="records")
-    os.remove("./ostatki.xls")  # Удалить файл
+    with zipfile.ZipFile(archive_file) as archive:
+        with archive.open("ostatki.xls") as excel_file:
+            workbook = CalamineWorkbook.from_filelike(excel_file)
+    rows = workbook.get_sheet_by_index(0).to_python(skip_empty_area=False)
+    headers = rows[17]
+    pick_columns = itemgetter(*(headers.index(name) for name in REMNANT_COLUMNS))
+    watch_remnants = [
+        dict(zip(REMNANT_COLUMNS, map(cell_to_str, pick_columns(row))))
+        for row in rows[18:]
+    ]
     return watch_remnants
 
 
+def cell_to_str(cell) -> str:
+    """Преобразует значение ячейки excel в строку.
+
+    Числа в xls хранятся как float, поэтому целые значения
+    записываются без дробной части.
+
+    Args:
+        cell: Значение ячейки, прочитанное calamine.
+
+    Returns:
+        str: Строковое значение ячейки.
+
+    Examples:
+        >>> cell_to_str(12345.0)
+        "12345"
+        >>> cell_to_str("5'990.00 руб.")
+        "5'990.00 руб."
+    """
+    if isinstance(cell, float) and cell.is_integer():
+        return str(int(cell))
+    return str(cell)
+
+
 def create_stocks(watch_remnants, offer_ids):
     """Формирует список остатков товаров для обновления озон.
     
@@ -168,7 +245,7 @@ def create_stocks(watch_remnants, offer_ids):
             Каждый словарь должен содержать ключи:
             - "Код": артикул товара
             - "Количество": количество на складе
-        offer_ids (list[str]): Список артикулов товаров из озон.
+        offer_ids (set[str]): Множество артикулов товаров из озон.
     
     Returns:
         list[dict]: Список словарей в формате для озон:
@@ -181,11 +258,11 @@ def create_stocks(watch_remnants, offer_ids):
         - Преобразует значение ">10" в 100
         - Значение "1" преобразуется в 0
         - Товары из offer_ids, отсутствующие в watch_remnants, добавляются с stock=0
-        - Удаляет обработанные offer_ids из входного списка
+        - Входное множество offer_ids не изменяется
     
     Examples:
         >>> remnants = [{"Код": "CASIO-123", "Количество": "5"}]
-         >>> ids = ["CASIO-123", "CASIO-456"]
+         >>> ids = {"CASIO-123", "CASIO-456"}
          >>> create_stocks(remnants, ids)
          [
             {"offer_id": "CASIO-123", "stock": 5},
@@ -193,21 +270,18 @@ def create_stocks(watch_remnants, offer_ids):
          ]
     """
     # Уберем то, что не загружено в seller
+    matched = set()
     stocks = []
     for watch in watch_remnants:
-        if str(watch.get("Код")) in offer_ids:
-            count = str(watch.get("Количество"))
-            if count == ">10":
-                stock = 100
-            elif count == "1":
-                stock = 0
-            else:
-                stock = int(watch.get("Количество"))
-            stocks.append({"offer_id": str(watch.get("Код")), "stock": stock})
-            offer_ids.remove(str(watch.get("Код")))
+        code = str(watch["Код"])
+        if code in offer_ids and code not in matched:
+            stock = stock_conversion(str(watch["Количество"]))
+            stocks.append({"offer_id": code, "stock": stock})
+            matched.add(code)
     # Добавим недостающее из загруженного:
-    for offer_id in offer_ids:
-        stocks.append({"offer_id": offer_id, "stock": 0})
+    stocks.extend(
+        [{"offer_id": offer_id, "stock": 0} for offer_id in offer_ids - matched]
+    )
     return stocks
 
 
@@ -222,7 +296,7 @@ def create_prices(watch_remnants, offer_ids):
             Каждый словарь должен содержать ключи:
             - "Код": артикул товара
             - "Количество": количество на складе
-        offer_ids (list[str]): Список артикулов товаров из озон.
+        offer_ids (set[str]): Множество артикулов товаров из озон.
 
     Returns:
         list[dict]: Список словарей в формате озон:
@@ -242,7 +316,7 @@ def create_prices(watch_remnants, offer_ids):
 
     Examples:
         >>> remnants = [{"Код": "CASIO-123", "Цена": "6'300.50 руб."}]
-        >>> ids = ["CASIO-123"]
+        >>> ids = {"CASIO-123"}
         >>> create_prices(remnants, ids)
         [{
             "auto_action_enabled": "UNKNOWN",
@@ -252,24 +326,27 @@ def create_prices(watch_remnants, offer_ids):
             "price": "6300"
         }]
     """
-    prices = []
-    for watch in watch_remnants:
-        if str(watch.get("Код")) in offer_ids:
-            price = {
-                "auto_action_enabled": "UNKNOWN",
-                "currency_code": "RUB",
-                "offer_id": str(watch.get("Код")),
-                "old_price": "0",
-                "price": price_conversion(watch.get("Цена")),
-            }
-            prices.append(price)
+    prices = [
+        {
+            "auto_action_enabled": "UNKNOWN",
+            "currency_code": "RUB",
+            "offer_id": code,
+            "old_price": "0",
+            "price": price_conversion(watch["Цена"]),
+        }
+        for watch in watch_remnants
+        if (code := str(watch["Код"])) in offer_ids
+    ]
     return prices
 
 
+@functools.lru_cache(maxsize=4096)
 def price_conversion(price: str) -> str:
     """Преобразует цену в формат для озон.
     
     Убирает из цены все символы, кроме цифр от 0 до 9.
+    Результат кешируется: одинаковые цены в файле дистрибьютора
+    обрабатываются один раз.
 
     Args:
         price(str): Строка с ценой из файла дистрибьютора. Например: "5'990.00 руб."
@@ -286,46 +363,89 @@ def price_conversion(price: str) -> str:
         >>> price_conversion(6300.50)  # число вместо строки
         Traceback (most recent call last):
         ...
-        AttributeError: 'float' object has no attribute 'split'
+        AttributeError: 'float' object has no attribute 'partition'
     """
-    return re.sub("[^0-9]", "", price.split(".")[0])
+    return NON_DIGITS.sub("", price.partition(".")[0])
+
+
+def stock_conversion(count: str) -> int:
+    """Преобразует остаток из файла дистрибьютора в количество для маркетплейса.
+
+    Args:
+        count(str): Остаток из файла дистрибьютора. Например: ">10" или "5"
+
+    Returns:
+        int: Количество товара. ">10" преобразуется в 100, "1" в 0.
+
+    Examples:
+        >>> stock_conversion(">10")
+        100
+        >>> stock_conversion("5")
+        5
+    """
+    stock = STOCK_OVERRIDES.get(count)
+    if stock is None:
+        stock = int(count)
+    return stock
 
 
 def divide(lst: list, n: int):
-    """Генератор, который выдаёт элементы списка lst по частям по n элементов.
+    """Разбивает список lst на части по n элементов.
     
-    Выполняет итерацию элементов списка lst с шагом n.
-
-    Цикл for в сочетании с функцией range() позволяет получать доступ к элементам списка по их индексу. Третий аргумент функции range() определяет шаг, с которым будет двигаться цикл.
-    По умолчанию шаг равен 1.
+    Использует itertools.batched, который делит список на части без копирования
+    срезов в Python-коде. На Python до 3.12 используется аналог на islice.
 
     Args:
         lst (list): Исходный список для разделения.
+        n (int): Размер одной части.
 
-    Yields:
-        list: Список элементов длиной не более `n`.
+    Returns:
+        iterator[tuple]: Кортежи элементов длиной не более `n`.
 
     Examples:
         >>> list(divide([1, 2, 3, 4, 5], 2))
-        [[1, 2], [3, 4], [5]]
+        [(1, 2), (3, 4), (5,)]
 
         Некорректный размер:
         >>> list(divide([1, 2, 3], 0))
         Traceback (most recent call last):
         ...
-        ValueError: n must be greater than 0
+        ValueError: n must be at least one
+    """
+    return batched(lst, n)
+
+
+async def send_batches(update, batches, *args, limit=8):
+    """Параллельно отправляет партии товаров в API маркетплейса.
+
+    Каждая партия отправляется функцией update в отдельном потоке,
+    одновременно выполняется не более limit запросов.
+
+    Args:
+        update (callable): Функция обновления, например update_price.
+        batches (iterable): Партии товаров, например результат divide().
+        *args: Остальные аргументы функции update (идентификатор клиента, ключ).
+        limit (int): Максимальное количество одновременных запросов.
+
+    Returns:
+        list[dict]: Ответы API в порядке следования партий.
     """
-    for i in range(0, len(lst), n):
-        yield lst[i : i + n]
+    semaphore = asyncio.Semaphore(limit)
+
+    async def send(batch):
+        async with semaphore:
+            return await asyncio.to_thread(update, batch, *args)
+
+    return await asyncio.gather(*(send(batch) for batch in batches))
 
 
-async def upload_prices(watch_remnants, client_id, seller_token):
+async def upload_prices(watch_remnants, client_id, seller_token, offer_ids=None):
     """Асинхронно обновляет цены товаров в озон и возвращает результаты.
     
     Процесс работы:
-    - Получает список всех артикулов из озон
+    - Получает список всех артикулов из озон, если он не передан
     - Формирует данные для обновления цен на основе прайса дистрибьютора и актуальных артикулов магазина
-    - Обновляет цены по 1000 товаров
+    - Параллельно обновляет цены партиями по 1000 товаров
     - Возвращает сформированные данные о ценах
 
     Args:
@@ -335,6 +455,8 @@ async def upload_prices(watch_remnants, client_id, seller_token):
             - "Количество": количество на складе
         client_id (str): Идентификатор клиента озон.
         seller_token (str): API-ключ продавца.
+        offer_ids (set[str], optional): Уже полученные артикулы товаров из озон.
+            Если не переданы, запрашиваются через get_offer_ids().
 
     Returns:
         list[dict]: Список всех сформированных цен в формате озон:
@@ -346,20 +468,20 @@ async def upload_prices(watch_remnants, client_id, seller_token):
                 "old_price": "0"
             }]
     """
-    offer_ids = get_offer_ids(client_id, seller_token)
+    if offer_ids is None:
+        offer_ids = set(get_offer_ids(client_id, seller_token))
     prices = create_prices(watch_remnants, offer_ids)
-    for some_price in list(divide(prices, 1000)):
-        update_price(some_price, client_id, seller_token)
+    await send_batches(update_price, divide(prices, 1000), client_id, seller_token)
     return prices
 
 
-async def upload_stocks(watch_remnants, client_id, seller_token):
+async def upload_stocks(watch_remnants, client_id, seller_token, offer_ids=None):
     """Асинхронно обновляет остатки товаров в озон и возвращает результаты.
     
     Процесс работы:
-    - Получает список всех артикулов из озон
+    - Получает список всех артикулов из озон, если он не передан
     - Формирует данные об остатках на основе файла дистрибьютора
-    - Обновляет остатки по 100 товаров
+    - Параллельно обновляет остатки партиями по 100 товаров
     - Фильтрует и возвращает результаты
 
     Args:
@@ -369,42 +491,47 @@ async def upload_stocks(watch_remnants, client_id, seller_token):
             - "Количество": количество на складе
         client_id (str): Идентификатор клиента озон.
         seller_token (str): API-ключ продавца.
+        offer_ids (set[str], optional): Уже полученные артикулы товаров из озон.
+            Если не переданы, запрашиваются через get_offer_ids().
 
     Returns:
         tuple[list[dict], list[dict]]: Кортеж из двух списков:
             - not_empty: товары с ненулевым остатком
             - stocks: все обновленные товары с остатками
     """
-    offer_ids = get_offer_ids(client_id, seller_token)
+    if offer_ids is None:
+        offer_ids = set(get_offer_ids(client_id, seller_token))
     stocks = create_stocks(watch_remnants, offer_ids)
-    for some_stock in list(divide(stocks, 100)):
-        update_stocks(some_stock, client_id, seller_token)
+    await send_batches(update_stocks, divide(stocks, 100), client_id, seller_token)
     not_empty = list(filter(lambda stock: (stock.get("stock") != 0), stocks))
     return not_empty, stocks
 
 
-def main():
+async def main():
     env = Env()
     seller_token = env.str("SELLER_TOKEN")
     client_id = env.str("CLIENT_ID")
     try:
-        offer_ids = get_offer_ids(client_id, seller_token)
+        offer_ids = set(get_offer_ids(client_id, seller_token))
         watch_remnants = download_stock()
         # Обновить остатки
-        stocks = create_stocks(watch_remnants, offer_ids)
-        for some_stock in list(divide(stocks, 100)):
-            update_stocks(some_stock, client_id, seller_token)
+        await upload_stocks(watch_remnants, client_id, seller_token, offer_ids)
         # Поменять цены
-        prices = create_prices(watch_remnants, offer_ids)
-        for some_price in list(divide(prices, 900)):
-            update_price(some_price, client_id, seller_token)
+        await upload_prices(watch_remnants, client_id, seller_token, offer_ids)
     except requests.exceptions.ReadTimeout:
         print("Превышено время ожидания...")
     except requests.exceptions.ConnectionError as error:
         print(error, "Ошибка соединения")
-    except Exception as error:
-        print(error, "ERROR_2")
+
+
+def run(coroutine):
+    """Запускает корутину в uvloop, если он установлен, иначе в asyncio."""
+    try:
+        import uvloop
+    except ImportError:
+        return asyncio.run(coroutine)
+    return uvloop.run(coroutine)
 
 
 if __name__ == "__main__":
-    main()
+    run(main())